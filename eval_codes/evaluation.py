@@ -3,11 +3,6 @@ import os
 import argparse
 
 import torch
-from torch import nn
-from torch.nn import functional as F
-import torchvision
-import torchvision.transforms.functional
-import torch.utils.data
 from PIL import Image
 from tqdm import tqdm
 import numpy as np
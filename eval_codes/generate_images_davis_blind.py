@@ -19,6 +19,9 @@ def generate_images(opt, checkpoint_path, out_dir, noise_levels, generate_inter_
     np.random.seed(seed)
     torch.manual_seed(seed)
     if torch.cuda.is_available(): torch.cuda.manual_seed(seed)
+    torch.backends.cudnn.benchmark = True
+    # Already the default for cuDNN convolutions; only pinned here
+    torch.backends.cudnn.allow_tf32 = True
     device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
     
     dataset_paths = sorted([d for d in glob.glob('datasets/DAVIS-test/JPEGImages/480p/*') if os.path.isdir(d)])
@@ -26,6 +29,7 @@ def generate_images(opt, checkpoint_path, out_dir, noise_levels, generate_inter_
     #dataset_paths = ['datasets/DAVIS-test/JPEGImages/480p/rollercoaster']
     network_module = importlib.import_module('models.network_blind')
     net = getattr(network_module, opt['model_type_test'])(opt).to(device)
+    if opt.get('channels_last', False): net = net.to(memory_format=torch.channels_last)
     checkpoint = torch.load(checkpoint_path, map_location=device)
     net.load_state_dict(convert_state_dict(checkpoint['netG_state_dict']), strict=True)
     net.eval()
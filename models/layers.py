@@ -1,31 +1,10 @@
+from collections import deque
+
 import torch
 from torch import nn
+from torch.nn import functional as F
 
 ### https://github.com/megvii-research/NAFNet/blob/main/basicsr/models/archs/NAFNet_arch.py
-class LayerNormFunction(torch.autograd.Function):
-    @staticmethod
-    def forward(ctx, x, weight, bias, eps):
-        ctx.eps = eps
-        N, C, H, W = x.size()
-        mu = x.mean(1, keepdim=True)
-        var = (x - mu).pow(2).mean(1, keepdim=True)
-        y = (x - mu) / (var + eps).sqrt()
-        ctx.save_for_backward(y, var, weight)
-        y = weight.view(1, C, 1, 1) * y + bias.view(1, C, 1, 1)
-        return y
-
-    @staticmethod
-    def backward(ctx, grad_output):
-        eps = ctx.eps
-        N, C, H, W = grad_output.size()
-        y, var, weight = ctx.saved_variables
-        g = grad_output * weight.view(1, C, 1, 1)
-        mean_g = g.mean(dim=1, keepdim=True)
-        mean_gy = (g * y).mean(dim=1, keepdim=True)
-        gx = 1. / torch.sqrt(var + eps) * (g - y * mean_gy - mean_g)
-        return gx, (grad_output * y).sum(dim=3).sum(dim=2).sum(dim=0), grad_output.sum(dim=3).sum(dim=2).sum(
-            dim=0), None
-
 class LayerNorm2d(nn.Module):
     def __init__(self, channels, eps=1e-6):
         super(LayerNorm2d, self).__init__()
@@ -34,12 +13,14 @@ class LayerNorm2d(nn.Module):
         self.eps = eps
 
     def forward(self, x):
-        return LayerNormFunction.apply(x, self.weight, self.bias, self.eps)
+        # (N,C,H,W) -> (N,H,W,C), a free view under channels_last
+        x = F.layer_norm(x.permute(0, 2, 3, 1), (x.shape[1],), self.weight, self.bias, self.eps)
+        return x.permute(0, 3, 1, 2)
 
 class PseudoTemporalFusion(nn.Module):
     def forward(self, x):
         x1, x2, x3 = x.chunk(3, dim=1)
-        return 0.5*(x1*x2 + x2*x3)
+        return 0.5*x2*(x1 + x3)
 
 class TemporalShift(nn.Module):
     def __init__(self, n_segment, shift_type, fold_div=8, stride=1):
@@ -56,12 +37,16 @@ class TemporalShift(nn.Module):
 
         fold = c // self.fold_div # 32/8 = 4
         
-        out = torch.zeros_like(x)
+        # each element is written once; only the vacated border slices are zeroed
+        out = torch.empty_like(x)
         if not 'toFutureOnly' in self.shift_type:
             out[:, :-self.stride, :fold] = x[:, self.stride:, :fold]  # backward (left shift)
+            out[:, -self.stride:, :fold] = 0
             out[:, self.stride:, fold: 2 * fold] = x[:, :-self.stride, fold: 2 * fold]  # forward (right shift)
+            out[:, :self.stride, fold: 2 * fold] = 0
         else:
             out[:, self.stride:, : 2 * fold] = x[:, :-self.stride, : 2 * fold] # right shift only
+            out[:, :self.stride, : 2 * fold] = 0
         out[:, :, 2 * fold:] = x[:, :, 2 * fold:]  # not shift
 
         return out.view(nt, c, h, w)
@@ -69,16 +54,17 @@ class TemporalShift(nn.Module):
 class MemSkip(nn.Module):
     def __init__(self):
         super(MemSkip, self).__init__()
-        self.mem_list = []
+        # FIFO: features pushed by earlier frames are popped first
+        self.mem_list = deque()
     def push(self, x):
         if x is not None:
-            self.mem_list.insert(0,x)
+            self.mem_list.append(x)
             return 1
         else:
             return 0
     def pop(self, x):
         if x is not None:
-            return self.mem_list.pop()
+            return self.mem_list.popleft()
         else:
             return None
 
@@ -151,10 +137,28 @@ class DenoisingLayersBBB(nn.Module):
         self.op = ShiftDenoisingLayers(dim, fold_div)
         self.left_fold_2fold = None
         self.center = None
+        self.zero_fold = None
+        self.left_buf = None
         
     def reset(self):
         self.left_fold_2fold = None
         self.center = None
+        self.zero_fold = None
+        self.left_buf = None
+    
+    def zeros_like_fold(self, x):
+        # Zero neighbour for the first/last frame, allocated once per shape/dtype/device
+        shape = (self.n, self.fold, self.h, self.w)
+        if self.zero_fold is None or self.zero_fold.shape != shape or self.zero_fold.dtype != x.dtype or self.zero_fold.device != x.device:
+            self.zero_fold = x.new_zeros(shape)
+        return self.zero_fold
+    
+    def keep_left_fold(self, center):
+        # Copy out the channels needed by the next frame so the full center tensor can be freed
+        left = center[:, self.fold:2*self.fold, :, :]
+        if self.left_buf is None or self.left_buf.shape != left.shape or self.left_buf.dtype != left.dtype or self.left_buf.device != left.device:
+            self.left_buf = torch.empty_like(left)
+        return self.left_buf.copy_(left)
         
     def forward(self, input_right):
         if input_right is not None:
@@ -166,7 +170,7 @@ class DenoisingLayersBBB(nn.Module):
             if input_right is not None:
                 if self.left_fold_2fold is None:
                     # In the start stage, the memory and left tensor is empty
-                    self.left_fold_2fold = torch.zeros((self.n, self.fold, self.h, self.w), device=torch.device('cuda'))
+                    self.left_fold_2fold = self.zeros_like_fold(input_right)
             else:
                 # in the end stage, both feed in and memory are empty
                 pass
@@ -175,10 +179,10 @@ class DenoisingLayersBBB(nn.Module):
         # Case2: Center is not None, but input_right is None
         elif input_right is None:
             # In the last procesing stage, center is 0
-            output =  self.op(self.left_fold_2fold, self.center, torch.zeros((self.n, self.fold, self.h, self.w), device=torch.device('cuda')))
+            output =  self.op(self.left_fold_2fold, self.center, self.zeros_like_fold(self.center))
         else:
             output =  self.op(self.left_fold_2fold, self.center, input_right)
-        self.left_fold_2fold = self.center[:, self.fold:2*self.fold, :, :]
+        self.left_fold_2fold = self.keep_left_fold(self.center)
         self.center = input_right
         return output
 
@@ -220,10 +224,28 @@ class DenoisingLayersBBBL(nn.Module):
         self.op = ShiftDenoisingLayersL(dim, fold_div)
         self.left_fold_2fold = None
         self.center = None
+        self.zero_fold = None
+        self.left_buf = None
         
     def reset(self):
         self.left_fold_2fold = None
         self.center = None
+        self.zero_fold = None
+        self.left_buf = None
+    
+    def zeros_like_fold(self, x):
+        # Zero neighbour for the first/last frame, allocated once per shape/dtype/device
+        shape = (self.n, self.fold, self.h, self.w)
+        if self.zero_fold is None or self.zero_fold.shape != shape or self.zero_fold.dtype != x.dtype or self.zero_fold.device != x.device:
+            self.zero_fold = x.new_zeros(shape)
+        return self.zero_fold
+    
+    def keep_left_fold(self, center):
+        # Copy out the channels needed by the next frame so the full center tensor can be freed
+        left = center[:, self.fold:2*self.fold, :, :]
+        if self.left_buf is None or self.left_buf.shape != left.shape or self.left_buf.dtype != left.dtype or self.left_buf.device != left.device:
+            self.left_buf = torch.empty_like(left)
+        return self.left_buf.copy_(left)
         
     def forward(self, input_right):
         if input_right is not None:
@@ -235,7 +257,7 @@ class DenoisingLayersBBBL(nn.Module):
             if input_right is not None:
                 if self.left_fold_2fold is None:
                     # In the start stage, the memory and left tensor is empty
-                    self.left_fold_2fold = torch.zeros((self.n, self.fold, self.h, self.w), device=torch.device('cuda'))
+                    self.left_fold_2fold = self.zeros_like_fold(input_right)
             else:
                 # in the end stage, both feed in and memory are empty
                 pass
@@ -244,9 +266,9 @@ class DenoisingLayersBBBL(nn.Module):
         # Case2: Center is not None, but input_right is None
         elif input_right is None:
             # In the last procesing stage, center is 0
-            output =  self.op(self.left_fold_2fold, self.center, torch.zeros((self.n, self.fold, self.h, self.w), device=torch.device('cuda')))
+            output =  self.op(self.left_fold_2fold, self.center, self.zeros_like_fold(self.center))
         else:
             output =  self.op(self.left_fold_2fold, self.center, input_right)
-        self.left_fold_2fold = self.center[:, self.fold:2*self.fold, :, :]
+        self.left_fold_2fold = self.keep_left_fold(self.center)
         self.center = input_right
         return output
\ No newline at end of file
@@ -10,16 +10,11 @@ class PSNRLoss(nn.Module):
         self.loss_weight = loss_weight
         self.scale = 10 / np.log(10)
         self.toY = toY
-        self.coef = torch.tensor([65.481, 128.553, 24.966]).reshape(1, 3, 1, 1)
-        self.first = True
+        self.register_buffer('coef', torch.tensor([65.481, 128.553, 24.966]).reshape(1, 3, 1, 1))
 
     def forward(self, pred, target):
         assert len(pred.size()) == 4
         if self.toY:
-            if self.first:
-                self.coef = self.coef.to(pred.device)
-                self.first = False
-
             pred = (pred * self.coef).sum(dim=1).unsqueeze(dim=1) + 16.
             target = (target * self.coef).sum(dim=1).unsqueeze(dim=1) + 16.
 
@@ -20,6 +20,8 @@ from scripts.utils import convert_state_dict, load_option, pad_tensor, send_line
 def train(opt_path):
     opt = EasyDict(load_option(opt_path))
     torch.backends.cudnn.benchmark = True
+    # Already the default for cuDNN convolutions; only pinned here
+    torch.backends.cudnn.allow_tf32 = True
     device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
         
     model_ckpt_dir = f'./experiments/{opt.name}/ckpt'
@@ -44,7 +46,9 @@ def train(opt_path):
     loss_fn = PSNRLoss().to(device)
     network_module = importlib.import_module('models.network')
     netG = getattr(network_module, opt['model_type_train'])(opt).to(device)
+    if opt.get('channels_last', False): netG = netG.to(memory_format=torch.channels_last)
     optimG = torch.optim.Adam(netG.parameters(), lr=opt.learning_rate_G, betas=opt.betas)
+    scalerG = torch.cuda.amp.GradScaler(enabled=opt.get('use_amp', False))
     schedulerG = torch.optim.lr_scheduler.CosineAnnealingLR(optimG, T_max=opt.T_max, eta_min=opt.eta_min)
     if opt.resume_step is not None:
         for _ in range(opt.resume_step): schedulerG.step()
@@ -55,6 +59,7 @@ def train(opt_path):
         netG.load_state_dict(netG_state_dict, strict=True)
 
     netG_val = getattr(network_module, opt['model_type_test'])(opt).to(device)
+    if opt.get('channels_last', False): netG_val = netG_val.to(memory_format=torch.channels_last)
     
     train_dataset = VideoDenoisingDatasetTrain(opt)
     train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=opt.batch_size, shuffle=True, num_workers=2)
@@ -80,12 +85,17 @@ def train(opt_path):
             
             # Training G
             netG.zero_grad()
-            gens = netG(input_seq, noise_map)
+            with torch.autocast(device_type='cuda', dtype=torch.float16, enabled=opt.get('use_amp', False)):
+                gens = netG(input_seq, noise_map)
+            gens = gens.float()
             loss_G = loss_fn(gens.reshape(b*f,c,h,w), gt_seq.reshape(b*f,c,h,w))
 
-            loss_G.backward()
-            if opt.use_grad_clip: torch.nn.utils.clip_grad_norm_(netG.parameters(), opt.grad_clip_val)
-            optimG.step()
+            scalerG.scale(loss_G).backward()
+            if opt.use_grad_clip:
+                scalerG.unscale_(optimG)
+                torch.nn.utils.clip_grad_norm_(netG.parameters(), opt.grad_clip_val)
+            scalerG.step(optimG)
+            scalerG.update()
             schedulerG.step()
             
             total_step += 1
@@ -166,6 +176,7 @@ def train(opt_path):
                             'total_step': total_step,
                             'netG_state_dict': netG.state_dict(),
                             'optimG_state_dict': optimG.state_dict(),
+                            'scalerG_state_dict': scalerG.state_dict(),
                         }, os.path.join(model_ckpt_dir, f'{opt.name}_best.ckpt'))
                 
                 if total_step%opt.save_freq==0 and opt.enable_line_nortify:
@@ -178,6 +189,7 @@ def train(opt_path):
                     'total_step': total_step,
                     'netG_state_dict': netG.state_dict(),
                     'optimG_state_dict': optimG.state_dict(),
+                    'scalerG_state_dict': scalerG.state_dict(),
                 }, os.path.join(model_ckpt_dir, f'{opt.name}_{str(total_step).zfill(len(str(opt.steps)))}.ckpt'))
                     
             if total_step==opt.steps:
@@ -185,6 +197,7 @@ def train(opt_path):
                     'total_step': total_step,
                     'netG_state_dict': netG.state_dict(),
                     'optimG_state_dict': optimG.state_dict(),
+                    'scalerG_state_dict': scalerG.state_dict(),
                 }, os.path.join(model_ckpt_dir, f'{opt.name}_{str(total_step).zfill(len(str(opt.steps)))}.ckpt'))
 
                 if opt.enable_line_nortify:
@@ -21,6 +21,8 @@ from scripts.utils import convert_state_dict, load_option, pad_tensor, send_line
 def train(opt_path):
     opt = EasyDict(load_option(opt_path))
     torch.backends.cudnn.benchmark = True
+    # Already the default for cuDNN convolutions; only pinned here
+    torch.backends.cudnn.allow_tf32 = True
     device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
         
     model_ckpt_dir = f'./experiments/{opt.name}/ckpt'
@@ -45,7 +47,9 @@ def train(opt_path):
     loss_fn = PSNRLoss().to(device)
     network_module = importlib.import_module('models.network_simplegate')
     netG = getattr(network_module, opt['model_type_train'])(opt).to(device)
+    if opt.get('channels_last', False): netG = netG.to(memory_format=torch.channels_last)
     optimG = torch.optim.Adam(netG.parameters(), lr=opt.learning_rate_G, betas=opt.betas)
+    scalerG = torch.cuda.amp.GradScaler(enabled=opt.get('use_amp', False))
     schedulerG = torch.optim.lr_scheduler.CosineAnnealingLR(optimG, T_max=opt.T_max, eta_min=opt.eta_min)
     if opt.resume_step is not None:
         for _ in range(opt.resume_step): schedulerG.step()
@@ -54,9 +58,11 @@ def train(opt_path):
         state_dict = torch.load(opt.pretrained_path, map_location=device)
         netG.load_state_dict(state_dict['netG_state_dict'], strict=True)
         optimG.load_state_dict(state_dict['optimG_state_dict'])
+        if state_dict.get('scalerG_state_dict'): scalerG.load_state_dict(state_dict['scalerG_state_dict'])
 
     netG = nn.DataParallel(netG, device_ids=[0,1,2,3])
     netG_val = getattr(network_module, opt['model_type_test'])(opt).to(device)
+    if opt.get('channels_last', False): netG_val = netG_val.to(memory_format=torch.channels_last)
     
     train_dataset = VideoDenoisingDatasetTrain(opt)
     train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=opt.batch_size, shuffle=True, num_workers=2)
@@ -82,14 +88,19 @@ def train(opt_path):
             
             # Training G
             netG.zero_grad()
-            gens, inter_imgs = netG(input_seq, noise_map)
+            with torch.autocast(device_type='cuda', dtype=torch.float16, enabled=opt.get('use_amp', False)):
+                gens, inter_imgs = netG(input_seq, noise_map)
+            gens, inter_imgs = gens.float(), inter_imgs.float()
             loss_G_inter = loss_fn(inter_imgs.reshape(b*f,c,h,w), gt_seq.reshape(b*f,c,h,w))
             loss_G_final = loss_fn(gens.reshape(b*f,c,h,w), gt_seq.reshape(b*f,c,h,w))
             loss_G = (loss_G_final + opt.inter_coef*loss_G_inter) / (1+opt.inter_coef)
 
-            loss_G.backward()
-            if opt.use_grad_clip: torch.nn.utils.clip_grad_norm_(netG.parameters(), opt.grad_clip_val)
-            optimG.step()
+            scalerG.scale(loss_G).backward()
+            if opt.use_grad_clip:
+                scalerG.unscale_(optimG)
+                torch.nn.utils.clip_grad_norm_(netG.parameters(), opt.grad_clip_val)
+            scalerG.step(optimG)
+            scalerG.update()
             schedulerG.step()
             
             total_step += 1
@@ -174,6 +185,7 @@ def train(opt_path):
                             'total_step': total_step,
                             'netG_state_dict': netG.module.state_dict(),
                             'optimG_state_dict': optimG.state_dict(),
+                            'scalerG_state_dict': scalerG.state_dict(),
                         }, os.path.join(model_ckpt_dir, f'{opt.name}_best.ckpt'))
                 
                 if total_step%opt.save_freq==0 and opt.enable_line_nortify:
@@ -186,6 +198,7 @@ def train(opt_path):
                     'total_step': total_step,
                     'netG_state_dict': netG.module.state_dict(),
                     'optimG_state_dict': optimG.state_dict(),
+                    'scalerG_state_dict': scalerG.state_dict(),
                 }, os.path.join(model_ckpt_dir, f'{opt.name}_{str(total_step).zfill(len(str(opt.steps)))}.ckpt'))
                     
             if total_step==opt.steps:
@@ -193,6 +206,7 @@ def train(opt_path):
                     'total_step': total_step,
                     'netG_state_dict': netG.module.state_dict(),
                     'optimG_state_dict': optimG.state_dict(),
+                    'scalerG_state_dict': scalerG.state_dict(),
                 }, os.path.join(model_ckpt_dir, f'{opt.name}_{str(total_step).zfill(len(str(opt.steps)))}.ckpt'))
 
                 if opt.enable_line_nortify: